@@ -1,113 +1,297 @@
 from fastapi import FastAPI, Request
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 import asyncio
-import json
-from datetime import datetime
-from typing import AsyncGenerator
+import gzip
+import hashlib
+import orjson
+import random
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import AsyncGenerator, Callable
 import logging
 
+from sse_frame import build_frame
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm the pre-rendered frames in the background so the worker is ready
+    # to accept connections immediately
+    warm = asyncio.create_task(_get_progress_frames())
+    yield
+    warm.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS for SSE
+# EventSource only issues GETs without credentials, so a plain wildcard origin
+# lets the middleware send a static header instead of echoing each Origin
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET"],
+    allow_headers=["Cache-Control", "Last-Event-ID"],
 )
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+# Shared SSE response headers
+_SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+}
+_SSE_HEADERS_NOBUF = {
+    **_SSE_HEADERS,
+    "X-Accel-Buffering": "no",  # Disable nginx buffering
+}
+
+# Pre-encoded "event:" lines for the event types the endpoints emit
+_EVENT_PREFIX = {
+    name: b"event: " + name.encode() + b"\n"
+    for name in (
+        "update", "done", "error", "log", "complete", "progress",
+        "connected", "status", "metrics", "warning", "chunk",
+    )
+}
+
+
+# Pre-encoded ids for the small integer ids the endpoints emit
+_ID_BYTES = [str(i).encode() for i in range(1024)]
 
-class SSEMessage:
-    """Helper class to format SSE messages"""
+
+def _sse_frame(
+    data: dict, event: str = None, id: int | str | bytes = None, retry: int = None
+) -> bytes:
+    """
+    Format data as SSE message.
+    SSE format:
+    event: <event_type>
+    id: <message_id>
+    retry: <reconnection_time_ms>
+    data: <json_data>
     
-    @staticmethod
-    def format(data: dict, event: str = None, id: str = None, retry: int = None) -> str:
-        """
-        Format data as SSE message.
-        SSE format:
-        event: <event_type>
-        id: <message_id>
-        retry: <reconnection_time_ms>
-        data: <json_data>
-        
-        (blank line to signal end of message)
-        """
-        message = ""
-        
-        if event:
-            message += f"event: {event}\n"
-        if id:
-            message += f"id: {id}\n"
-        if retry:
-            message += f"retry: {retry}\n"
-        
-        # Handle multi-line data
-        if isinstance(data, (dict, list)):
-            data = json.dumps(data)
-        
-        for line in str(data).splitlines():
-            message += f"data: {line}\n"
-        
-        message += "\n"  # Extra newline to signal end of message
-        return message
+    (blank line to signal end of message)
+
+    Fields are encoded here and the frame itself is assembled by
+    sse_frame.build_frame, which can be compiled with mypyc.
+    """
+    if event:
+        event_line = _EVENT_PREFIX.get(event) or b"event: " + event.encode() + b"\n"
+    else:
+        event_line = b""
+    if id is None:
+        id = b""
+    elif isinstance(id, int):
+        id = _ID_BYTES[id] if 0 <= id < len(_ID_BYTES) else str(id).encode()
+    elif isinstance(id, str):
+        id = id.encode()
+    
+    if isinstance(data, (dict, list)):
+        payload = orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    else:
+        payload = str(data).encode()
+    
+    return build_frame(payload, event_line, id, retry or 0)
+
+
+def _sse_comment(text: str) -> bytes:
+    """Send a comment (ignored by clients, useful for keep-alive)"""
+    return b": " + text.encode() + b"\n\n"
+
+
+_ts_second = -1
+_ts_value = None
+
+
+def _utc_timestamp() -> datetime:
+    """
+    Current UTC time at second resolution.
+    The datetime is only rebuilt when the wall-clock second changes, so every
+    event emitted within the same second reuses one object.
+    """
+    global _ts_second, _ts_value
+    second = int(time.time())
+    if second != _ts_second:
+        _ts_value = datetime.fromtimestamp(second, timezone.utc)
+        _ts_second = second
+    return _ts_value
+
+
+async def _poll_client_disconnect(request: Request, disconnected: asyncio.Event) -> None:
+    """Poll the receive channel once per second and flag the disconnect"""
+    while not await request.is_disconnected():
+        await asyncio.sleep(1)
+    disconnected.set()
+
+
+def watch_client_disconnect(request: Request) -> tuple[asyncio.Event, asyncio.Task]:
+    """
+    Start a background watcher for client disconnects.
+    Generators check the returned event instead of awaiting
+    request.is_disconnected() on every message, and cancel the task when done.
+    """
+    disconnected = asyncio.Event()
+    watcher = asyncio.create_task(_poll_client_disconnect(request, disconnected))
+    return disconnected, watcher
+
+
+_KEEPALIVE = _sse_comment("keep-alive")
+
+
+async def _with_heartbeat(
+    agen: AsyncGenerator[bytes, None], interval: float, heartbeat: Callable[[], bytes]
+) -> AsyncGenerator[bytes, None]:
+    """
+    Interleave heartbeat comments into a stream on their own timer.
+    The source generator and a ticker task both feed one queue, so heartbeats
+    keep flowing while the source is slow to produce its next frame.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=32)
+    
+    async def pump() -> None:
+        # The end marker is None, or the exception that stopped the source.
+        # It is only sent when the source finishes on its own; on cancellation
+        # nobody is reading the queue, so putting into it could block forever
+        try:
+            async for frame in agen:
+                await queue.put(frame)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await queue.put(e)
+        else:
+            await queue.put(None)
+    
+    async def tick() -> None:
+        while True:
+            await asyncio.sleep(interval)
+            await queue.put(heartbeat())
+    
+    pumper = asyncio.create_task(pump())
+    ticker = asyncio.create_task(tick())
+    
+    try:
+        while (item := await queue.get()) is not None:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        ticker.cancel()
+        pumper.cancel()
+        await asyncio.gather(pumper, ticker, return_exceptions=True)
+        await agen.aclose()
+
+
+# The index page is read and gzip-compressed once at startup
+# mtime=0 keeps the gzip header (and so its ETag) identical across workers
+# and restarts while index.html is unchanged
+_INDEX_HTML = Path("static/index.html").read_bytes()
+_INDEX_GZ = gzip.compress(_INDEX_HTML, 9, mtime=0)
+_INDEX_ETAG = f'"{hashlib.md5(_INDEX_HTML, usedforsecurity=False).hexdigest()}"'
+_INDEX_GZ_ETAG = f'"{hashlib.md5(_INDEX_GZ, usedforsecurity=False).hexdigest()}"'
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """Check whether an Accept-Encoding header allows gzip with a nonzero q"""
+    gzip_q = wildcard_q = None
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name in ("gzip", "x-gzip"):
+            gzip_q = q
+        elif name == "*":
+            wildcard_q = q
     
-    @staticmethod
-    def comment(text: str) -> str:
-        """Send a comment (ignored by clients, useful for keep-alive)"""
-        return f": {text}\n\n"
+    if gzip_q is not None:
+        return gzip_q > 0
+    return wildcard_q is not None and wildcard_q > 0
 
 
-async def check_client_disconnect(request: Request) -> bool:
-    """Check if client has disconnected"""
-    return await request.is_disconnected()
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weakly compare an ETag against the list in an If-None-Match header"""
+    if if_none_match.strip() == "*":
+        return True
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
 
 
-# Redirect root to static index.html
+# Serve the precompressed index page at the root
 @app.get("/")
-async def root():
-    from fastapi.responses import RedirectResponse
-    return RedirectResponse(url="/static/index.html")
+async def root(request: Request):
+    if _accepts_gzip(request.headers.get("accept-encoding", "")):
+        body, etag = _INDEX_GZ, _INDEX_GZ_ETAG
+        headers = {"Content-Encoding": "gzip"}
+    else:
+        body, etag = _INDEX_HTML, _INDEX_ETAG
+        headers = {}
+    
+    headers.update({
+        "ETag": etag,
+        "Cache-Control": "public, max-age=300",
+        "Vary": "Accept-Encoding",
+    })
+    
+    if _etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+    
+    return Response(body, media_type="text/html", headers=headers)
 
 
 # Example 1: Basic streaming with heartbeat
-@app.get("/stream/basic")
 async def stream_basic(request: Request):
-    async def event_generator() -> AsyncGenerator[str, None]:
+    async def event_generator() -> AsyncGenerator[bytes, None]:
+        sse_frame = _sse_frame
+        
+        disconnected, watcher = watch_client_disconnect(request)
+        
         try:
+            # Tick on fixed deadlines so emit time doesn't accumulate as drift
+            loop = asyncio.get_running_loop()
+            start = loop.time()
             count = 0
             while True:
                 # Check if client disconnected
-                if await check_client_disconnect(request):
+                if disconnected.is_set():
                     logger.info("Client disconnected")
                     break
                 
                 count += 1
                 data = {
                     "count": count,
-                    "timestamp": datetime.now().isoformat(),
+                    "timestamp": _utc_timestamp(),
                     "message": f"Update #{count}"
                 }
                 
-                yield SSEMessage.format(data, event="update", id=str(count))
+                yield sse_frame(data, event="update", id=count)
                 
-                # Send heartbeat comment every 15 seconds to keep connection alive
-                if count % 15 == 0:
-                    yield SSEMessage.comment(f"heartbeat {datetime.now().isoformat()}")
-                
-                await asyncio.sleep(1)
+                await asyncio.sleep(max(0, start + count - loop.time()))
                 
                 if count >= 30:
                     # Send completion event
-                    yield SSEMessage.format(
+                    yield sse_frame(
                         {"status": "complete", "total": count},
                         event="done"
                     )
@@ -117,27 +301,28 @@ async def stream_basic(request: Request):
             logger.info("Stream cancelled")
             raise
         except Exception as e:
-            logger.error(f"Stream error: {e}")
-            yield SSEMessage.format(
+            logger.error("Stream error: %s", e)
+            yield sse_frame(
                 {"error": str(e)},
                 event="error"
             )
+        finally:
+            watcher.cancel()
     
+    def heartbeat() -> bytes:
+        return _sse_comment(f"heartbeat {_utc_timestamp().isoformat()}")
+    
+    # Send heartbeat comment every 15 seconds to keep connection alive
     return StreamingResponse(
-        event_generator(),
+        _with_heartbeat(event_generator(), 15, heartbeat),
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no",  # Disable nginx buffering
-        }
+        headers=_SSE_HEADERS_NOBUF,
     )
 
 
 # Example 2: Simulated log streaming
-@app.get("/stream/logs")
 async def stream_logs(request: Request):
-    async def log_generator() -> AsyncGenerator[str, None]:
+    async def log_generator() -> AsyncGenerator[bytes, None]:
         log_levels = ["INFO", "DEBUG", "WARNING", "ERROR"]
         messages = [
             "Application started",
@@ -149,67 +334,93 @@ async def stream_logs(request: Request):
             "Background job queued",
             "Metrics collected",
         ]
+        choice = random.choice
+        sse_frame = _sse_frame
+        
+        disconnected, watcher = watch_client_disconnect(request)
         
         try:
             for i, message in enumerate(messages):
-                if await check_client_disconnect(request):
+                if disconnected.is_set():
                     break
                 
-                import random
                 log_entry = {
-                    "timestamp": datetime.now().isoformat(),
-                    "level": random.choice(log_levels),
+                    "timestamp": _utc_timestamp(),
+                    "level": choice(log_levels),
                     "message": message,
                     "line": i + 1
                 }
                 
-                yield SSEMessage.format(log_entry, event="log", id=str(i))
+                yield sse_frame(log_entry, event="log", id=i)
                 await asyncio.sleep(0.5)
             
-            yield SSEMessage.format({"status": "EOF"}, event="complete")
+            yield sse_frame({"status": "EOF"}, event="complete")
             
         except asyncio.CancelledError:
             logger.info("Log stream cancelled")
             raise
+        finally:
+            watcher.cancel()
     
     return StreamingResponse(
         log_generator(),
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-        }
+        headers=_SSE_HEADERS,
     )
 
 
 # Example 3: Progress tracking
-@app.get("/stream/progress")
+PROGRESS_STEPS = [
+    "Initializing...",
+    "Loading dependencies...",
+    "Processing data...",
+    "Running calculations...",
+    "Generating report...",
+    "Finalizing...",
+    "Complete!"
+]
+
+# Progress frames never change, so they are rendered once per process.
+# Rendering happens off the event loop after startup rather than at import
+_PROGRESS_FRAMES: list[bytes] | None = None
+
+
+def _build_progress_frames() -> list[bytes]:
+    """Render every progress frame"""
+    return [
+        _sse_frame(
+            {
+                "step": i + 1,
+                "total": len(PROGRESS_STEPS),
+                "percentage": round((i + 1) / len(PROGRESS_STEPS) * 100, 2),
+                "message": step,
+            },
+            event="progress",
+            id=i
+        )
+        for i, step in enumerate(PROGRESS_STEPS)
+    ]
+
+
+async def _get_progress_frames() -> list[bytes]:
+    """Return the progress frames, rendering them in the executor on first use"""
+    global _PROGRESS_FRAMES
+    if _PROGRESS_FRAMES is None:
+        loop = asyncio.get_running_loop()
+        _PROGRESS_FRAMES = await loop.run_in_executor(None, _build_progress_frames)
+    return _PROGRESS_FRAMES
+
+
 async def stream_progress(request: Request):
-    async def progress_generator() -> AsyncGenerator[str, None]:
-        steps = [
-            "Initializing...",
-            "Loading dependencies...",
-            "Processing data...",
-            "Running calculations...",
-            "Generating report...",
-            "Finalizing...",
-            "Complete!"
-        ]
+    async def progress_generator() -> AsyncGenerator[bytes, None]:
+        disconnected, watcher = watch_client_disconnect(request)
         
         try:
-            for i, step in enumerate(steps):
-                if await check_client_disconnect(request):
+            for frame in await _get_progress_frames():
+                if disconnected.is_set():
                     break
                 
-                progress = {
-                    "step": i + 1,
-                    "total": len(steps),
-                    "percentage": round((i + 1) / len(steps) * 100, 2),
-                    "message": step,
-                    "timestamp": datetime.now().isoformat()
-                }
-                
-                yield SSEMessage.format(progress, event="progress", id=str(i))
+                yield frame
                 
                 # Simulate work
                 await asyncio.sleep(2)
@@ -217,131 +428,161 @@ async def stream_progress(request: Request):
         except asyncio.CancelledError:
             logger.info("Progress stream cancelled")
             raise
+        finally:
+            watcher.cancel()
     
     return StreamingResponse(
         progress_generator(),
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-        }
+        headers=_SSE_HEADERS,
     )
 
 
 # Example 4: Multiple event types with error handling
-@app.get("/stream/multi")
 async def stream_multi_events(request: Request):
-    async def multi_event_generator() -> AsyncGenerator[str, None]:
+    async def multi_event_generator() -> AsyncGenerator[bytes, None]:
+        uniform, randint = random.uniform, random.randint
+        sse_frame = _sse_frame
+        
+        disconnected, watcher = watch_client_disconnect(request)
+        
         try:
             # Send initial connection event
-            yield SSEMessage.format(
-                {"connected": True, "timestamp": datetime.now().isoformat()},
+            yield sse_frame(
+                {"connected": True, "timestamp": _utc_timestamp()},
                 event="connected",
-                id="0"
+                id=0
             )
             
             for i in range(20):
-                if await check_client_disconnect(request):
+                if disconnected.is_set():
                     break
                 
-                # Send different types of events
+                # Send different types of events; all frames for one
+                # iteration are joined so they go out in a single send.
+                # Keep-alive comments come from the heartbeat ticker
                 if i % 5 == 0:
                     # Status event
-                    yield SSEMessage.format(
+                    out = sse_frame(
                         {"status": "healthy", "uptime": i},
                         event="status"
                     )
                 elif i % 3 == 0:
                     # Metric event
-                    import random
-                    yield SSEMessage.format(
+                    out = sse_frame(
                         {
-                            "cpu": random.uniform(0, 100),
-                            "memory": random.uniform(0, 100),
-                            "requests": random.randint(0, 1000)
+                            "cpu": uniform(0, 100),
+                            "memory": uniform(0, 100),
+                            "requests": randint(0, 1000)
                         },
                         event="metrics"
                     )
                 else:
                     # Regular update
-                    yield SSEMessage.format(
+                    out = sse_frame(
                         {"count": i, "message": f"Update {i}"},
                         event="update",
-                        id=str(i)
+                        id=i
                     )
                 
                 # Simulate an error condition
                 if i == 10:
-                    yield SSEMessage.format(
+                    out += sse_frame(
                         {"message": "Warning: High memory usage detected"},
                         event="warning"
                     )
                 
-                # Heartbeat comment
-                if i % 5 == 0:
-                    yield SSEMessage.comment("keep-alive")
+                yield out
                 
                 await asyncio.sleep(1)
             
             # Send final event
-            yield SSEMessage.format(
+            yield sse_frame(
                 {"message": "Stream completed"},
                 event="complete"
             )
             
         except asyncio.CancelledError:
             logger.info("Multi-event stream cancelled")
-            yield SSEMessage.format(
+            yield sse_frame(
                 {"message": "Stream interrupted"},
                 event="error"
             )
             raise
         except Exception as e:
-            logger.error(f"Error in stream: {e}")
-            yield SSEMessage.format(
+            logger.error("Error in stream: %s", e)
+            yield sse_frame(
                 {"error": str(e)},
                 event="error"
             )
+        finally:
+            watcher.cancel()
     
     return StreamingResponse(
-        multi_event_generator(),
+        _with_heartbeat(multi_event_generator(), 5, lambda: _KEEPALIVE),
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no",
-        }
+        headers=_SSE_HEADERS_NOBUF,
     )
 
 
 # Example 5: Simulated chat/AI response streaming
-@app.get("/stream/chat")
-async def stream_chat(request: Request, message: str = "Hello, how are you?"):
-    async def chat_generator() -> AsyncGenerator[str, None]:
+# Only short responses are cached. The cache key comes from the client's
+# ?message= value and each entry keeps every rendered frame, so caching long
+# messages would let clients pin large amounts of memory in every worker
+_CHAT_CACHE_MAX_LEN = 1024
+
+
+def _chat_chunk_frames(response: str) -> tuple[bytes, ...]:
+    """Return the chunk frames for a response, cached when it is short"""
+    if len(response) <= _CHAT_CACHE_MAX_LEN:
+        return _cached_chat_chunk_frames(response)
+    return _render_chat_chunk_frames(response)
+
+
+def _render_chat_chunk_frames(response: str) -> tuple[bytes, ...]:
+    """Render the word-by-word chunk frames for a response"""
+    words = response.split()
+    return tuple(
+        _sse_frame(
+            {
+                "chunk": word + " ",
+                "index": i,
+                "is_final": i == len(words) - 1
+            },
+            event="chunk",
+            id=i
+        )
+        for i, word in enumerate(words)
+    )
+
+
+_cached_chat_chunk_frames = lru_cache(maxsize=128)(_render_chat_chunk_frames)
+
+
+async def stream_chat(request: Request):
+    message = request.query_params.get("message", "Hello, how are you?")
+    
+    async def chat_generator() -> AsyncGenerator[bytes, None]:
         response = f"Thanks for asking '{message}'! Here's my response in chunks..."
         
+        disconnected, watcher = watch_client_disconnect(request)
+        
         try:
             # Stream word by word
-            words = response.split()
-            for i, word in enumerate(words):
-                if await check_client_disconnect(request):
+            frames = _chat_chunk_frames(response)
+            for frame in frames:
+                if disconnected.is_set():
                     break
                 
-                chunk = {
-                    "chunk": word + " ",
-                    "index": i,
-                    "is_final": i == len(words) - 1
-                }
-                
-                yield SSEMessage.format(chunk, event="chunk", id=str(i))
+                yield frame
                 await asyncio.sleep(0.1)
             
             # Send completion event
-            yield SSEMessage.format(
+            yield _sse_frame(
                 {
                     "content": response,
-                    "tokens": len(words),
-                    "completed_at": datetime.now().isoformat()
+                    "tokens": len(frames),
+                    "completed_at": _utc_timestamp()
                 },
                 event="done"
             )
@@ -349,17 +590,36 @@ async def stream_chat(request: Request, message: str = "Hello, how are you?"):
         except asyncio.CancelledError:
             logger.info("Chat stream cancelled")
             raise
+        finally:
+            watcher.cancel()
     
     return StreamingResponse(
         chat_generator(),
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-        }
+        headers=_SSE_HEADERS,
     )
 
 
+# The SSE endpoints only take the raw Request, so they are registered as plain
+# Starlette routes and skip FastAPI's parameter parsing and validation
+app.add_route("/stream/basic", stream_basic, methods=["GET"])
+app.add_route("/stream/logs", stream_logs, methods=["GET"])
+app.add_route("/stream/progress", stream_progress, methods=["GET"])
+app.add_route("/stream/multi", stream_multi_events, methods=["GET"])
+app.add_route("/stream/chat", stream_chat, methods=["GET"])
+
+
 if __name__ == "__main__":
+    import os
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # An import string is required when running more than one worker.
+    # "auto" picks uvloop and httptools when they are installed
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="auto",
+        http="auto",
+        workers=os.cpu_count(),
+        log_level="warning",
+    )
\ No newline at end of file
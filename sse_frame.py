@@ -0,0 +1,32 @@
+"""
+Byte-level SSE framing used by main.py.
+
+This module has no third-party imports and is fully annotated so it can be
+compiled with mypyc (`mypyc sse_frame.py`). When no compiled extension is
+present the pure-Python version is imported instead.
+"""
+
+
+def build_frame(
+    data: bytes, event_line: bytes = b"", id: bytes = b"", retry: int = 0
+) -> bytes:
+    """
+    Build an SSE message from pre-encoded fields.
+    event_line is the complete "event: <name>\\n" line so callers can pass a
+    cached one. Empty fields are omitted and each line of data gets its own
+    data: line.
+    """
+    parts: list[bytes] = []
+
+    if event_line:
+        parts.append(event_line)
+    if id:
+        parts.append(b"id: " + id + b"\n")
+    if retry:
+        parts.append(b"retry: " + str(retry).encode() + b"\n")
+
+    for line in data.splitlines():
+        parts.append(b"data: " + line + b"\n")
+
+    parts.append(b"\n")  # Extra newline to signal end of message
+    return b"".join(parts)